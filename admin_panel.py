@@ -2,21 +2,34 @@
 Admin Panel Routes
 """
 
+import os
+
+import jinja2
 from fastapi import APIRouter, Request, Form
-from fastapi.responses import JSONResponse, HTMLResponse
+from fastapi.responses import ORJSONResponse, HTMLResponse
 from fastapi.templating import Jinja2Templates
 
-from app.database import Database
-
 router = APIRouter()
-db = Database()
-templates = Jinja2Templates(directory="web/templates")
+
+def create_templates():
+    """Build the shared template env and compile admin templates"""
+    templates = Jinja2Templates(directory="web/templates")
+    
+    # Keep compiled templates around; only re-stat the files in debug mode
+    os.makedirs(".jinja_cache", exist_ok=True)
+    templates.env.auto_reload = os.getenv("DEBUG", "false").lower() == "true"
+    templates.env.bytecode_cache = jinja2.FileSystemBytecodeCache(".jinja_cache")
+    
+    for name in ("admin.html", "codes.html", "voices.html"):
+        templates.env.get_template(name)
+    
+    return templates
 
 @router.get("/admin/codes")
 async def admin_codes(request: Request):
     """Access codes management"""
-    codes = db.get_all_codes()
-    return templates.TemplateResponse("codes.html", {
+    codes = await request.app.state.db.get_all_codes()
+    return request.app.state.templates.TemplateResponse("codes.html", {
         "request": request,
         "codes": codes
     })
@@ -24,20 +37,21 @@ async def admin_codes(request: Request):
 @router.get("/admin/voices")
 async def admin_voices(request: Request):
     """Voice models management"""
-    voices = db.get_all_voices()
-    return templates.TemplateResponse("voices.html", {
+    voices = await request.app.state.db.get_all_voices()
+    return request.app.state.templates.TemplateResponse("voices.html", {
         "request": request,
         "voices": voices
     })
 
 @router.post("/api/admin/codes/create")
 async def create_access_code(
+    request: Request,
     quota: int = Form(50000),
     days: int = Form(30)
 ):
     """Create new access code"""
-    code = db.create_access_code(quota, days)
-    return JSONResponse({
+    code = await request.app.state.db.create_access_code(quota, days)
+    return ORJSONResponse({
         "success": True,
         "code": code,
         "message": f"Access code created: {code}"
@@ -45,6 +59,7 @@ async def create_access_code(
 
 @router.post("/api/admin/voices/add")
 async def add_voice(
+    request: Request,
     name: str = Form(...),
     voice_id: str = Form(...),
     model: str = Form("speech-2.6-turbo"),
@@ -53,27 +68,27 @@ async def add_voice(
     image_url: str = Form(None)
 ):
     """Add new voice model"""
-    success = db.add_voice(name, voice_id, model, language, gender, image_url)
+    success = await request.app.state.db.add_voice(name, voice_id, model, language, gender, image_url)
     
     if success:
-        return JSONResponse({
+        return ORJSONResponse({
             "success": True,
             "message": "Voice added successfully"
         })
     else:
-        return JSONResponse({
+        return ORJSONResponse({
             "success": False,
             "message": "Failed to add voice"
         }, status_code=400)
 
 @router.get("/api/admin/codes")
-async def api_get_codes():
+async def api_get_codes(request: Request):
     """API: Get all access codes"""
-    codes = db.get_all_codes()
-    return JSONResponse(codes)
+    codes = await request.app.state.db.get_all_codes()
+    return ORJSONResponse(codes)
 
 @router.get("/api/admin/voices")
-async def api_get_voices():
+async def api_get_voices(request: Request):
     """API: Get all voices"""
-    voices = db.get_all_voices()
-    return JSONResponse(voices)
+    voices = await request.app.state.db.get_all_voices()
+    return ORJSONResponse(voices)
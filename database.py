@@ -3,128 +3,301 @@ Simplified Database for Render
 """
 
 import sqlite3
+import asyncio
 import logging
-from datetime import datetime
+import secrets
+import string
+import time
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta
 import os
 
+import aiosqlite
+
 logger = logging.getLogger(__name__)
 
+# Seconds a cached listing stays valid
+_VOICES_TTL = 60
+_CODES_TTL = 5
+
+# Characters used in generated access codes
+_ALPHABET = string.ascii_uppercase + string.digits
+
+_SCHEMA_SQL = '''
+BEGIN;
+
+CREATE TABLE IF NOT EXISTS access_codes (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    code TEXT UNIQUE NOT NULL,
+    quota_total INTEGER DEFAULT 50000,
+    quota_used INTEGER DEFAULT 0,
+    expiry_date DATETIME,
+    is_active BOOLEAN DEFAULT 1,
+    created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS voice_models (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name TEXT NOT NULL,
+    voice_id TEXT UNIQUE NOT NULL,
+    model TEXT DEFAULT 'speech-2.6-turbo',
+    language TEXT DEFAULT 'en',
+    gender TEXT,
+    image_url TEXT,
+    is_active BOOLEAN DEFAULT 1,
+    created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Default voice
+INSERT OR IGNORE INTO voice_models
+(name, voice_id, model, language, gender, image_url)
+VALUES
+('Moss Audio (Turbo)', 'moss_audio_4d4208c8-b67d-11f0-afaf-868268514f62',
+ 'speech-2.6-turbo', 'en', 'male', 'https://i.imgur.com/gBqjH3S.png');
+
+COMMIT;
+'''
+
+SQL_INSERT_ACCESS_CODE = '''
+    INSERT INTO access_codes (code, quota_total, expiry_date)
+    VALUES (?, ?, ?)
+'''
+SQL_GET_ALL_CODES = '''
+    SELECT *, quota_total - quota_used AS quota_remaining
+    FROM access_codes ORDER BY created_at DESC
+'''
+SQL_INSERT_VOICE = '''
+    INSERT INTO voice_models (name, voice_id, model, language, gender, image_url)
+    VALUES (?, ?, ?, ?, ?, ?)
+'''
+SQL_GET_ALL_VOICES = 'SELECT * FROM voice_models ORDER BY name'
+
+def _generate_code():
+    """Generate a random access code"""
+    return "TTS-" + "".join(secrets.choice(_ALPHABET) for _ in range(15))
+
+def _rows_to_dicts(description, rows):
+    """Zip plain tuple rows with their column names"""
+    columns = tuple(column[0] for column in description)
+    return [dict(zip(columns, row)) for row in rows]
+
 class Database:
-    def __init__(self, db_path="data/tts_bot.db"):
+    def __init__(self, db_path="data/tts_bot.db", max_size=10, min_size=2, timeout=30):
         self.db_path = db_path
+        self.max_size = max_size
+        self.min_size = min_size
+        self.timeout = timeout
+        
+        # Connection pool (opened lazily on the running event loop)
+        self._pool = None
+        self._pool_created = 0
+        self._connections = set()
+        
+        # Listing caches, dropped on writes; a write bumps the generation so an
+        # overlapping read can't repopulate the cache with rows from before it
+        self._voices_cache = None
+        self._voices_cache_ts = 0
+        self._voices_gen = 0
+        self._codes_cache = None
+        self._codes_cache_ts = 0
+        self._codes_gen = 0
+        
         self.init_db()
     
-    def get_connection(self):
-        """Get database connection"""
-        # Create data directory if not exists
-        os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+    async def _create_connection(self):
+        """Open a new pooled database connection"""
+        # Larger statement cache so every hot query keeps its compiled program
+        conn = await aiosqlite.connect(self.db_path, cached_statements=256)
         
-        conn = sqlite3.connect(self.db_path)
-        conn.row_factory = sqlite3.Row
+        # Tune once per connection: WAL lets readers run alongside a writer
+        await conn.execute("PRAGMA journal_mode=WAL")
+        await conn.execute("PRAGMA synchronous=NORMAL")
+        await conn.execute("PRAGMA temp_store=MEMORY")
+        await conn.execute("PRAGMA mmap_size=268435456")
+        await conn.execute("PRAGMA cache_size=-20000")
+        await conn.execute("PRAGMA busy_timeout=5000")
+        
+        # Tracked so close_pool can reach connections that are checked out
+        self._connections.add(conn)
         return conn
     
+    async def open_pool(self):
+        """Create the pool and pre-open min_size connections"""
+        if self._pool is not None:
+            return
+        
+        self._pool = asyncio.Queue(maxsize=self.max_size)
+        for _ in range(self.min_size):
+            self._pool_created += 1
+            self._pool.put_nowait(await self._create_connection())
+    
+    @asynccontextmanager
+    async def connection(self):
+        """Borrow a connection from the pool"""
+        if self._pool is None:
+            await self.open_pool()
+        
+        try:
+            conn = self._pool.get_nowait()
+        except asyncio.QueueEmpty:
+            if self._pool_created < self.max_size:
+                # Reserve the slot before awaiting so concurrent callers can't overshoot
+                self._pool_created += 1
+                try:
+                    conn = await self._create_connection()
+                except Exception:
+                    self._pool_created -= 1
+                    raise
+            else:
+                conn = await asyncio.wait_for(self._pool.get(), self.timeout)
+        
+        try:
+            yield conn
+        finally:
+            await self._release(conn)
+    
+    async def _release(self, conn):
+        """Return a borrowed connection to the pool"""
+        if conn not in self._connections:
+            # close_pool already closed it while it was checked out
+            return
+        
+        if self._pool is None:
+            # Opened while the pool was closing; don't leave its thread running
+            self._connections.discard(conn)
+            await conn.close()
+            return
+        
+        # Never hand out a connection with a half-finished transaction
+        if conn.in_transaction:
+            await conn.rollback()
+        self._pool.put_nowait(conn)
+    
+    async def close_pool(self):
+        """Close every pooled connection, including ones still checked out"""
+        if self._pool is None:
+            return
+        
+        # Each aiosqlite connection owns a non-daemon thread that blocks exit until closed
+        connections, self._connections = self._connections, set()
+        self._pool = None
+        self._pool_created = 0
+        for conn in connections:
+            await conn.close()
+    
+    async def health_check(self):
+        """Check that a pooled connection can run a query"""
+        try:
+            async with self.connection() as conn:
+                await conn.execute("SELECT 1")
+            return True
+        except Exception as e:
+            logger.error(f"Database health check failed: {e}")
+            return False
+    
     def init_db(self):
         """Initialize database tables"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
-        # Create tables
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS access_codes (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                code TEXT UNIQUE NOT NULL,
-                quota_total INTEGER DEFAULT 50000,
-                quota_used INTEGER DEFAULT 0,
-                expiry_date DATETIME,
-                is_active BOOLEAN DEFAULT 1,
-                created_at DATETIME DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-        
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS voice_models (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                name TEXT NOT NULL,
-                voice_id TEXT UNIQUE NOT NULL,
-                model TEXT DEFAULT 'speech-2.6-turbo',
-                language TEXT DEFAULT 'en',
-                gender TEXT,
-                image_url TEXT,
-                is_active BOOLEAN DEFAULT 1,
-                created_at DATETIME DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-        
-        # Insert default voice
-        cursor.execute('''
-            INSERT OR IGNORE INTO voice_models 
-            (name, voice_id, model, language, gender, image_url)
-            VALUES 
-            ('Moss Audio (Turbo)', 'moss_audio_4d4208c8-b67d-11f0-afaf-868268514f62', 
-             'speech-2.6-turbo', 'en', 'male', 'https://i.imgur.com/gBqjH3S.png')
-        ''')
-        
-        conn.commit()
+        # Create data directory if not exists
+        os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+        
+        # Schema setup runs once at startup, so it stays on plain sqlite3
+        conn = sqlite3.connect(self.db_path)
+        conn.executescript(_SCHEMA_SQL)
         conn.close()
         logger.info("Database initialized successfully")
     
-    def create_access_code(self, quota=50000, days=30):
+    async def create_access_code(self, quota=50000, days=30):
         """Create new access code"""
-        import random
-        import string
-        
         # Generate random code
-        code = f"TTS-{''.join(random.choices(string.ascii_uppercase + string.digits, k=15))}"
-        
-        conn = self.get_connection()
-        cursor = conn.cursor()
+        code = _generate_code()
         
         # Calculate expiry date
-        from datetime import datetime, timedelta
         expiry_date = datetime.now() + timedelta(days=days)
         
-        cursor.execute('''
-            INSERT INTO access_codes (code, quota_total, expiry_date)
-            VALUES (?, ?, ?)
-        ''', (code, quota, expiry_date))
-        
-        conn.commit()
-        conn.close()
+        async with self.connection() as conn:
+            await conn.execute(SQL_INSERT_ACCESS_CODE, (code, quota, expiry_date))
+            await conn.commit()
+        self._codes_gen += 1
+        self._codes_cache = None
         
         return code
     
-    def get_all_codes(self):
+    async def bulk_create_codes(self, count, quota=50000, days=30):
+        """Create several access codes in one transaction"""
+        expiry_date = datetime.now() + timedelta(days=days)
+        codes = [_generate_code() for _ in range(count)]
+        
+        async with self.connection() as conn:
+            await conn.executemany(
+                SQL_INSERT_ACCESS_CODE,
+                [(code, quota, expiry_date) for code in codes]
+            )
+            await conn.commit()
+        self._codes_gen += 1
+        self._codes_cache = None
+        
+        return codes
+    
+    async def get_all_codes(self):
         """Get all access codes"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
+        if self._codes_cache is not None and time.time() - self._codes_cache_ts < _CODES_TTL:
+            return self._codes_cache
         
-        cursor.execute('SELECT * FROM access_codes ORDER BY created_at DESC')
-        rows = cursor.fetchall()
-        conn.close()
+        generation = self._codes_gen
+        async with self.connection() as conn:
+            async with conn.execute(SQL_GET_ALL_CODES) as cursor:
+                rows = await cursor.fetchall()
+                description = cursor.description
         
-        return [dict(row) for row in rows]
+        codes = _rows_to_dicts(description, rows)
+        if generation == self._codes_gen:
+            self._codes_cache = codes
+            self._codes_cache_ts = time.time()
+        return codes
     
-    def get_all_voices(self):
+    async def get_all_voices(self):
         """Get all voice models"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
+        if self._voices_cache is not None and time.time() - self._voices_cache_ts < _VOICES_TTL:
+            return self._voices_cache
         
-        cursor.execute('SELECT * FROM voice_models ORDER BY name')
-        rows = cursor.fetchall()
-        conn.close()
+        generation = self._voices_gen
+        async with self.connection() as conn:
+            async with conn.execute(SQL_GET_ALL_VOICES) as cursor:
+                rows = await cursor.fetchall()
+                description = cursor.description
         
-        return [dict(row) for row in rows]
+        voices = _rows_to_dicts(description, rows)
+        if generation == self._voices_gen:
+            self._voices_cache = voices
+            self._voices_cache_ts = time.time()
+        return voices
     
-    def add_voice(self, name, voice_id, model="speech-2.6-turbo", language="en", gender=None, image_url=None):
+    async def add_voice(self, name, voice_id, model="speech-2.6-turbo", language="en", gender=None, image_url=None):
         """Add new voice model"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            INSERT INTO voice_models (name, voice_id, model, language, gender, image_url)
-            VALUES (?, ?, ?, ?, ?, ?)
-        ''', (name, voice_id, model, language, gender, image_url))
+        async with self.connection() as conn:
+            await conn.execute(SQL_INSERT_VOICE, (name, voice_id, model, language, gender, image_url))
+            await conn.commit()
+        self._voices_gen += 1
+        self._voices_cache = None
+        return True
+    
+    async def bulk_add_voices(self, voices):
+        """Add several voice models in one transaction"""
+        rows = [
+            (
+                voice['name'],
+                voice['voice_id'],
+                voice.get('model', 'speech-2.6-turbo'),
+                voice.get('language', 'en'),
+                voice.get('gender'),
+                voice.get('image_url')
+            )
+            for voice in voices
+        ]
         
-        conn.commit()
-        conn.close()
+        async with self.connection() as conn:
+            await conn.executemany(SQL_INSERT_VOICE, rows)
+            await conn.commit()
+        self._voices_gen += 1
+        self._voices_cache = None
         return True
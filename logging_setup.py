@@ -0,0 +1,39 @@
+"""
+Logging Setup - one root configuration for the whole app
+"""
+
+import atexit
+import os
+import logging
+import logging.handlers
+import queue
+
+_listener = None
+
+def configure_logging():
+    """Route the root logger through a queue; handlers write on a listener thread"""
+    global _listener
+    
+    # main.py may be imported twice (as __main__ and as app.main); configure once
+    if _listener is not None:
+        return _listener
+    
+    os.makedirs("logs", exist_ok=True)
+    log_queue = queue.Queue(-1)
+    
+    formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    handlers = (logging.StreamHandler(), logging.FileHandler("logs/app.log"))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+    
+    _listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    
+    # The listener serves the whole process, not one app lifespan; stop it
+    # (flushing queued records) at exit, ahead of logging's own shutdown
+    atexit.register(_listener.stop)
+    
+    logging.root.addHandler(logging.handlers.QueueHandler(log_queue))
+    logging.root.setLevel(os.getenv("LOG_LEVEL", "INFO").upper())
+    
+    return _listener
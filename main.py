@@ -3,71 +3,218 @@ Main Application - Render.com Optimized
 """
 
 import os
+import re
+import asyncio
 import sys
+import gzip
+import hashlib
 import logging
-from fastapi import FastAPI, Request
-from fastapi.responses import JSONResponse, HTMLResponse
+import mimetypes
+import time
+from contextlib import asynccontextmanager
+from pathlib import Path
+from fastapi import FastAPI, Request, Response
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import ORJSONResponse, HTMLResponse
 from fastapi.staticfiles import StaticFiles
-from fastapi.templating import Jinja2Templates
+from starlette.datastructures import Headers
+import orjson
 import uvicorn
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
+# Configure logging before the app modules create their loggers
+from app.logging_setup import configure_logging
+configure_logging()
+
+from app.admin_panel import router as admin_router, create_templates
+from app.database import Database
+from app.telegram_bot import TelegramBot
+
 logger = logging.getLogger(__name__)
 
+# Static docs page, with validators computed once so clients can revalidate
+DOCS_HTML = """
+    <!DOCTYPE html>
+    <html>
+    <head><title>API Docs</title></head>
+    <body>
+        <h1>TTS Bot API Documentation</h1>
+        <p>Visit <a href="/swagger">/swagger</a> for Swagger UI</p>
+    </body>
+    </html>
+    """
+DOCS_ETAG = f'"{hashlib.md5(DOCS_HTML.encode()).hexdigest()}"'
+DOCS_HEADERS = {"ETag": DOCS_ETAG, "Cache-Control": "public, max-age=3600"}
+
+# Constant JSON bodies, serialized once at import
+ROOT_BODY = orjson.dumps({
+    "status": "running",
+    "service": "TTS Bot API",
+    "version": "1.0.0",
+    "docs": "/docs",
+    "health": "/health",
+    "admin": "/admin"
+})
+HEALTH_BODIES = {
+    db_ok: orjson.dumps({
+        "status": "healthy" if db_ok else "degraded",
+        "service": "tts-bot",
+        "database": "ok" if db_ok else "error",
+        "timestamp": "2024-01-01T00:00:00Z"
+    })
+    for db_ok in (True, False)
+}
+
+# Last database probe as (monotonic time, ok)
+_HEALTH_TTL = 5
+_last_health = (float("-inf"), False)
+
+# Assets with a content hash in the name (app.3f9a1c2b.css) never change
+_HASHED_ASSET = re.compile(r"\.[0-9a-f]{8,}\.")
+_COMPRESSIBLE = {".css", ".js", ".svg", ".html", ".json", ".txt"}
+
+class CachedStaticFiles(StaticFiles):
+    """Static files with Cache-Control and precompressed gzip variants"""
+    
+    def file_response(self, full_path, stat_result, scope, status_code=200):
+        gz_path = f"{full_path}.gz"
+        accepts_gzip = "gzip" in Headers(scope=scope).get("accept-encoding", "")
+        
+        if accepts_gzip and os.path.isfile(gz_path):
+            response = super().file_response(gz_path, os.stat(gz_path), scope, status_code)
+            media_type = mimetypes.guess_type(str(full_path))[0] or "text/plain"
+            if media_type.startswith("text/"):
+                media_type += "; charset=utf-8"
+            response.headers["Content-Type"] = media_type
+            response.headers["Content-Encoding"] = "gzip"
+        else:
+            response = super().file_response(full_path, stat_result, scope, status_code)
+        
+        # ETag/Last-Modified come from FileResponse (mtime + size)
+        if _HASHED_ASSET.search(os.path.basename(full_path)):
+            response.headers["Cache-Control"] = "public, max-age=31536000, immutable"
+        else:
+            response.headers["Cache-Control"] = "public, max-age=300"
+        response.headers["Vary"] = "Accept-Encoding"
+        return response
+
+def precompress_static(directory="web/static"):
+    """Write .gz siblings for text assets that are missing or stale"""
+    for path in Path(directory).rglob("*"):
+        if path.suffix not in _COMPRESSIBLE or not path.is_file():
+            continue
+        
+        gz_path = path.with_name(path.name + ".gz")
+        if gz_path.exists() and gz_path.stat().st_mtime >= path.stat().st_mtime:
+            continue
+        
+        # Write then rename so other workers never serve a partial file
+        tmp_path = gz_path.with_name(f"{gz_path.name}.{os.getpid()}.tmp")
+        tmp_path.write_bytes(gzip.compress(path.read_bytes(), compresslevel=9))
+        os.replace(tmp_path, gz_path)
+
+def _report_bot_failure(task: asyncio.Task):
+    """Log bot startup errors as soon as they happen"""
+    if not task.cancelled() and task.exception() is not None:
+        logger.error(f"Telegram bot failed to start: {task.exception()}")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Open shared resources once per worker, after fork"""
+    app.state.db = Database()
+    bot = bot_task = None
+    try:
+        await app.state.db.open_pool()
+        app.state.templates = create_templates()
+        precompress_static()
+        
+        # The bot polls on this event loop instead of a thread of its own,
+        # sharing the app's Database so admin writes reach its caches
+        try:
+            bot = TelegramBot(app.state.db)
+        except ValueError as e:
+            # Missing credentials only disable the bot; /health and /admin still serve
+            logger.error(f"Telegram bot disabled: {e}")
+        else:
+            bot_task = asyncio.create_task(bot.start_async())
+            bot_task.add_done_callback(_report_bot_failure)
+        app.state.bot = bot
+        yield
+    finally:
+        # Stop in order so in-flight handlers, FFmpeg and HTTP sessions wind down;
+        # a failing step must not skip the ones after it
+        if bot_task is not None:
+            bot_task.cancel()
+            await asyncio.gather(bot_task, return_exceptions=True)
+        if bot is not None:
+            try:
+                await bot.stop_async()
+            except Exception as e:
+                logger.error(f"Telegram bot shutdown failed: {e}")
+        try:
+            await app.state.db.close_pool()
+        except Exception as e:
+            logger.error(f"Database shutdown failed: {e}")
+
 # Create app
-app = FastAPI(title="TTS Bot API", version="1.0.0")
+app = FastAPI(
+    title="TTS Bot API",
+    version="1.0.0",
+    default_response_class=ORJSONResponse,
+    lifespan=lifespan,
+    # Swagger moves aside so /docs is served by api_docs below
+    docs_url="/swagger"
+)
 
-# Templates
-templates = Jinja2Templates(directory="web/templates")
+# Compress JSON/HTML; precompressed static files already carry Content-Encoding and pass through
+app.add_middleware(GZipMiddleware, minimum_size=512, compresslevel=5)
+
+# Admin routes (templates are shared with the admin panel)
+app.include_router(admin_router)
 
 # Mount static files
-app.mount("/static", StaticFiles(directory="web/static"), name="static")
+app.mount("/static", CachedStaticFiles(directory="web/static"), name="static")
 
 @app.get("/")
 async def root():
-    return {
-        "status": "running",
-        "service": "TTS Bot API",
-        "version": "1.0.0",
-        "docs": "/docs",
-        "health": "/health",
-        "admin": "/admin"
-    }
+    return Response(ROOT_BODY, media_type="application/json")
 
 @app.get("/health")
-async def health_check():
-    return JSONResponse({
-        "status": "healthy",
-        "service": "tts-bot",
-        "timestamp": "2024-01-01T00:00:00Z"
-    })
+async def health_check(request: Request):
+    global _last_health
+    
+    # Probe the database at most once per _HEALTH_TTL, however often we're pinged
+    checked_at, db_ok = _last_health
+    if time.monotonic() - checked_at >= _HEALTH_TTL:
+        db_ok = await request.app.state.db.health_check()
+        _last_health = (time.monotonic(), db_ok)
+    
+    # Render's health check only looks at the status code, so a dead database must fail it
+    return Response(
+        HEALTH_BODIES[db_ok],
+        status_code=200 if db_ok else 503,
+        media_type="application/json"
+    )
 
 @app.get("/admin")
 async def admin_dashboard(request: Request):
-    return templates.TemplateResponse("admin.html", {"request": request})
+    return request.app.state.templates.TemplateResponse("admin.html", {"request": request})
 
 @app.get("/docs")
-async def api_docs():
-    return HTMLResponse("""
-    <!DOCTYPE html>
-    <html>
-    <head><title>API Docs</title></head>
-    <body>
-        <h1>TTS Bot API Documentation</h1>
-        <p>Visit <a href="/docs">/docs</a> for Swagger UI</p>
-    </body>
-    </html>
-    """)
+async def api_docs(request: Request):
+    if request.headers.get("if-none-match") == DOCS_ETAG:
+        return Response(status_code=304, headers=DOCS_HEADERS)
+    return HTMLResponse(DOCS_HTML, headers=DOCS_HEADERS)
 
 if __name__ == "__main__":
     port = int(os.getenv("PORT", 8000))
+    # Each worker runs its own lifespan, and with it its own bot poller;
+    # Telegram rejects concurrent getUpdates, so default to one worker
     uvicorn.run(
-        app,
+        "app.main:app",
         host="0.0.0.0",
         port=port,
-        log_level="info"
+        log_level="info",
+        loop="uvloop",
+        http="httptools",
+        workers=int(os.getenv("WEB_CONCURRENCY", "1"))
     )
@@ -5,13 +5,16 @@ Minimax API Client for TTS Generation
 import os
 import aiohttp
 import asyncio
+import hashlib
 import logging
-import subprocess
-import tempfile
+from collections import OrderedDict
 from typing import Dict, Any, Optional
 
 logger = logging.getLogger(__name__)
 
+# MP3s larger than this are fetched as two halves over parallel connections
+_RANGE_SPLIT_MIN = 256 * 1024
+
 class MinimaxAPI:
     """Minimax API Client"""
     
@@ -23,6 +26,35 @@ class MinimaxAPI:
         if not self.group_id or not self.api_key:
             logger.error("❌ Minimax credentials not set!")
             raise ValueError("MINIMAX_GROUP_ID and MINIMAX_API_KEY are required")
+        
+        # Shared HTTP session, created lazily on the running event loop
+        self._session: Optional[aiohttp.ClientSession] = None
+        
+        # LRU cache of converted audio, bounded by entries and total bytes
+        self._cache: "OrderedDict[bytes, Dict[str, Any]]" = OrderedDict()
+        self._cache_max = 512
+        self._cache_max_bytes = 64 * 1024 * 1024
+        self._cache_bytes = 0
+    
+    async def _get_session(self) -> aiohttp.ClientSession:
+        """Get the shared HTTP session"""
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(
+                    limit=64,
+                    limit_per_host=16,
+                    ttl_dns_cache=300,
+                    keepalive_timeout=60
+                ),
+                timeout=aiohttp.ClientTimeout(total=60)
+            )
+        return self._session
+    
+    async def close(self):
+        """Close the shared HTTP session"""
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
     
     async def generate_tts(self, text: str, voice_id: str, **kwargs) -> Dict[str, Any]:
         """
@@ -55,58 +87,74 @@ class MinimaxAPI:
             if emotion != 'auto':
                 payload['voice_setting']['emotion'] = emotion
             
+            # Identical requests reuse previously converted audio
+            voice_setting = payload['voice_setting']
+            key = hashlib.blake2b(
+                f"{payload['model']}|{voice_id}|{voice_setting['speed']}|{voice_setting['pitch']}|"
+                f"{voice_setting['vol']}|{emotion}|".encode() + text.encode(),
+                digest_size=16
+            ).digest()
+            
+            cached = self._cache.get(key)
+            if cached is not None:
+                self._cache.move_to_end(key)
+                return cached
+            
             # Make API request
-            async with aiohttp.ClientSession() as session:
-                url = f"{self.base_url}/v1/t2a_v2?GroupId={self.group_id}"
+            session = await self._get_session()
+            url = f"{self.base_url}/v1/t2a_v2?GroupId={self.group_id}"
+            
+            headers = {
+                "Authorization": f"Bearer {self.api_key}",
+                "Content-Type": "application/json"
+            }
+            
+            async with session.post(url, json=payload, headers=headers) as response:
+                if response.status != 200:
+                    error_text = await response.text()
+                    logger.error(f"Minimax API error: {error_text}")
+                    return {
+                        'success': False,
+                        'error': f'API Error: {response.status}'
+                    }
                 
-                headers = {
-                    "Authorization": f"Bearer {self.api_key}",
-                    "Content-Type": "application/json"
-                }
+                data = await response.json()
+                
+                if data.get('base_resp', {}).get('status_code') != 0:
+                    error_msg = data.get('base_resp', {}).get('status_msg', 'Unknown error')
+                    return {
+                        'success': False,
+                        'error': f'Minimax Error: {error_msg}'
+                    }
                 
-                async with session.post(url, json=payload, headers=headers) as response:
-                    if response.status != 200:
-                        error_text = await response.text()
-                        logger.error(f"Minimax API error: {error_text}")
-                        return {
-                            'success': False,
-                            'error': f'API Error: {response.status}'
-                        }
-                    
-                    data = await response.json()
-                    
-                    if data.get('base_resp', {}).get('status_code') != 0:
-                        error_msg = data.get('base_resp', {}).get('status_msg', 'Unknown error')
-                        return {
-                            'success': False,
-                            'error': f'Minimax Error: {error_msg}'
-                        }
-                    
-                    mp3_url = data.get('data', {}).get('audio')
-                    if not mp3_url:
-                        return {
-                            'success': False,
-                            'error': 'No audio URL in response'
-                        }
-                    
-                    # Download and convert MP3 to OGG
-                    audio_data = await self._download_and_convert(mp3_url)
-                    
-                    if not audio_data:
-                        return {
-                            'success': False,
-                            'error': 'Failed to process audio'
-                        }
-                    
+                mp3_url = data.get('data', {}).get('audio')
+                if not mp3_url:
                     return {
-                        'success': True,
-                        'audio_data': audio_data,
-                        'format': 'ogg',
-                        'codec': 'libopus',
-                        'sample_rate': 48000,
-                        'channels': 1
+                        'success': False,
+                        'error': 'No audio URL in response'
                     }
-                    
+                
+                # Download and convert MP3 to OGG
+                audio_data = await self._download_and_convert(mp3_url)
+                
+                if not audio_data:
+                    return {
+                        'success': False,
+                        'error': 'Failed to process audio'
+                    }
+                
+                result = {
+                    'success': True,
+                    'audio_data': audio_data,
+                    'format': 'ogg',
+                    'codec': 'libopus',
+                    'sample_rate': 48000,
+                    'channels': 1,
+                    'duration': self._ogg_duration(audio_data)
+                }
+                self._cache_put(key, result)
+                return result
+                
         except asyncio.TimeoutError:
             return {
                 'success': False,
@@ -119,29 +167,39 @@ class MinimaxAPI:
                 'error': str(e)
             }
     
+    def _cache_put(self, key: bytes, result: Dict[str, Any]):
+        """Store a result, evicting least recently used entries"""
+        previous = self._cache.pop(key, None)
+        if previous is not None:
+            self._cache_bytes -= len(previous['audio_data'])
+        
+        self._cache[key] = result
+        self._cache_bytes += len(result['audio_data'])
+        
+        while len(self._cache) > self._cache_max or self._cache_bytes > self._cache_max_bytes:
+            _, evicted = self._cache.popitem(last=False)
+            self._cache_bytes -= len(evicted['audio_data'])
+    
+    @staticmethod
+    def _ogg_duration(ogg_data: bytes) -> int:
+        """Duration in whole seconds from the last Ogg page's granule position"""
+        last_page = ogg_data.rfind(b'OggS')
+        if last_page < 0:
+            return 0
+        
+        # Opus granule positions always count 48 kHz samples
+        granule = int.from_bytes(ogg_data[last_page + 6:last_page + 14], 'little')
+        return max(1, round(granule / 48000))
+    
     async def _download_and_convert(self, mp3_url: str) -> Optional[bytes]:
         """Download MP3 and convert to OGG/Opus"""
+        process = None
+        split = tail = None
         try:
-            # Download MP3
-            async with aiohttp.ClientSession() as session:
-                async with session.get(mp3_url) as response:
-                    if response.status != 200:
-                        logger.error(f"Failed to download audio: {response.status}")
-                        return None
-                    
-                    mp3_data = await response.read()
-            
-            # Convert to OGG/Opus using FFmpeg
-            with tempfile.NamedTemporaryFile(suffix='.mp3', delete=False) as mp3_file:
-                mp3_file.write(mp3_data)
-                mp3_path = mp3_file.name
-            
-            ogg_path = mp3_path.replace('.mp3', '.ogg')
-            
-            # FFmpeg command for OGG/Opus conversion
+            # FFmpeg command for OGG/Opus conversion (MP3 on stdin, OGG on stdout)
             ffmpeg_cmd = [
                 'ffmpeg',
-                '-i', mp3_path,
+                '-i', 'pipe:0',
                 '-c:a', 'libopus',
                 '-ar', '48000',
                 '-ac', '1',
@@ -151,45 +209,98 @@ class MinimaxAPI:
                 '-application', 'audio',
                 '-frame_duration', '20',
                 '-f', 'ogg',
-                ogg_path
+                'pipe:1'
             ]
             
-            # Run FFmpeg
-            process = await asyncio.create_subprocess_exec(
-                *ffmpeg_cmd,
-                stdout=asyncio.subprocess.PIPE,
-                stderr=asyncio.subprocess.PIPE
-            )
+            # Download MP3 straight into FFmpeg while collecting its output
+            session = await self._get_session()
+            async with session.get(mp3_url) as response:
+                if response.status != 200:
+                    logger.error(f"Failed to download audio: {response.status}")
+                    return None
+                
+                process = await asyncio.create_subprocess_exec(
+                    *ffmpeg_cmd,
+                    stdin=asyncio.subprocess.PIPE,
+                    stdout=asyncio.subprocess.PIPE,
+                    stderr=asyncio.subprocess.PIPE
+                )
+                
+                # Large files: the second half downloads while the first streams in
+                length = response.content_length
+                if (length and length > _RANGE_SPLIT_MIN
+                        and response.headers.get('Accept-Ranges') == 'bytes'):
+                    split = length // 2
+                    tail = asyncio.create_task(self._fetch_range(session, mp3_url, split))
+                
+                _, ogg_data, stderr = await asyncio.gather(
+                    self._feed_ffmpeg(process, response, split, tail),
+                    process.stdout.read(),
+                    process.stderr.read()
+                )
             
-            stdout, stderr = await process.communicate()
+            await process.wait()
             
             if process.returncode != 0:
                 logger.error(f"FFmpeg error: {stderr.decode()}")
                 return None
             
-            # Read converted file
-            with open(ogg_path, 'rb') as f:
-                ogg_data = f.read()
-            
-            # Cleanup
-            import os
-            os.unlink(mp3_path)
-            os.unlink(ogg_path)
-            
             return ogg_data
             
         except Exception as e:
             logger.error(f"Audio conversion error: {e}")
             return None
         finally:
-            # Ensure cleanup
-            import os
-            for path in [mp3_path, ogg_path]:
-                if os.path.exists(path):
-                    try:
-                        os.unlink(path)
-                    except:
-                        pass
+            # Also runs on cancellation: never leave FFmpeg behind as a zombie
+            if tail is not None and not tail.done():
+                tail.cancel()
+            if process is not None and process.returncode is None:
+                process.kill()
+                await process.wait()
+    
+    @staticmethod
+    async def _fetch_range(session: aiohttp.ClientSession, url: str, start: int) -> Optional[bytes]:
+        """Download url from byte start onwards, or None if the range isn't honoured"""
+        try:
+            async with session.get(url, headers={'Range': f'bytes={start}-'}) as response:
+                content_range = response.headers.get('Content-Range', '')
+                if response.status != 206 or not content_range.startswith(f'bytes {start}-'):
+                    return None
+                return await response.read()
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            logger.warning(f"Range download failed, continuing on one connection: {e}")
+            return None
+    
+    @staticmethod
+    async def _feed_ffmpeg(process, response, split=None, tail=None):
+        """Stream the MP3 download into FFmpeg's stdin in small chunks"""
+        try:
+            if tail is not None:
+                # Only the first split bytes come from this response
+                remaining = split
+                while remaining:
+                    chunk = await response.content.read(min(64 * 1024, remaining))
+                    if not chunk:
+                        break
+                    remaining -= len(chunk)
+                    process.stdin.write(chunk)
+                    await process.stdin.drain()
+                
+                tail_data = await tail
+                if tail_data is not None:
+                    process.stdin.write(tail_data)
+                    await process.stdin.drain()
+                    return
+            
+            # Also picks up where the head left off if the range request failed
+            async for chunk in response.content.iter_chunked(64 * 1024):
+                process.stdin.write(chunk)
+                await process.stdin.drain()
+        except (BrokenPipeError, ConnectionResetError):
+            # FFmpeg exited early; the caller logs its stderr and exit status
+            pass
+        finally:
+            process.stdin.close()
     
     async def get_available_voices(self) -> list:
         """Get available voices from Minimax"""
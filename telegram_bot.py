@@ -3,13 +3,14 @@ Telegram Bot for TTS - Render.com Optimized
 """
 
 import os
+import re
 import logging
 import asyncio
+from functools import lru_cache
 from typing import Dict, Any
 import aiohttp
-import io
 
-from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, InputFile
 from telegram.ext import (
     Application, 
     CommandHandler, 
@@ -19,36 +20,18 @@ from telegram.ext import (
     CallbackQueryHandler
 )
 from telegram.constants import ParseMode
+from telegram.request import HTTPXRequest
 
 from app.database import Database
 from app.minimax_api import MinimaxAPI
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
 logger = logging.getLogger(__name__)
 
-class TelegramBot:
-    """Telegram Bot Handler"""
-    
-    def __init__(self):
-        self.bot_token = os.getenv("BOT_TOKEN")
-        self.application = None
-        self.db = Database()
-        self.minimax = MinimaxAPI()
-        
-        if not self.bot_token:
-            logger.error("❌ BOT_TOKEN environment variable not set!")
-            raise ValueError("BOT_TOKEN is required")
-    
-    async def start_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
-        """Handle /start command"""
-        user = update.effective_user
-        
-        welcome_text = f"""
-🎤 *Welcome to TTS Bot*, {user.first_name}!
+# Message templates, built once at import
+ADMIN_URL = os.getenv("RENDER_EXTERNAL_URL", "https://your-app.onrender.com")
+
+WELCOME_TEXT = """
+🎤 *Welcome to TTS Bot*, {first_name}!
 
 I can convert text to high-quality speech with multiple voices.
 
@@ -63,33 +46,10 @@ I can convert text to high-quality speech with multiple voices.
 
 *Example:* `/tts Hello world`
 
-*Admin Panel:* {os.getenv("RENDER_EXTERNAL_URL", "https://your-app.onrender.com")}/admin
+*Admin Panel:* {admin_url}/admin
         """
-        
-        # Add user to database
-        await self.db.add_user(
-            telegram_id=user.id,
-            username=user.username,
-            first_name=user.first_name,
-            last_name=user.last_name
-        )
-        
-        keyboard = [
-            [InlineKeyboardButton("🎵 Browse Voices", callback_data="browse_voices")],
-            [InlineKeyboardButton("🔑 Set Access Code", callback_data="set_code")],
-            [InlineKeyboardButton("📊 Check Quota", callback_data="check_quota")]
-        ]
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        
-        await update.message.reply_text(
-            welcome_text,
-            parse_mode=ParseMode.MARKDOWN,
-            reply_markup=reply_markup
-        )
-    
-    async def help_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
-        """Handle /help command"""
-        help_text = """
+
+HELP_TEXT = """
 *🤖 TTS Bot Help*
 
 *Basic Commands:*
@@ -121,8 +81,99 @@ I can convert text to high-quality speech with multiple voices.
 
 *Support:* Contact admin for help.
         """
+
+QUOTA_TEXT = """
+📊 *Your Quota*
+
+*Access Code:* `{code}`
+*Total:* {total:,} characters
+*Used:* {used:,} characters
+*Remaining:* {remaining:,} characters
+*Usage:* {usage:.1f}%
+
+*Estimated Usage:*
+• Short messages (100 chars): ~{short_uses:,} times
+• Medium messages (500 chars): ~{medium_uses:,} times
+        """
+
+# Access codes look like TTS-XXXXXXXXXXXXXXX
+_CODE_RE = re.compile(r'TTS-[A-Z0-9-]{6,}')
+
+# Keyboards
+_START_MARKUP = InlineKeyboardMarkup([
+    [InlineKeyboardButton("🎵 Browse Voices", callback_data="browse_voices")],
+    [InlineKeyboardButton("🔑 Set Access Code", callback_data="set_code")],
+    [InlineKeyboardButton("📊 Check Quota", callback_data="check_quota")]
+])
+
+@lru_cache(maxsize=1)
+def _voices_markup(voices):
+    """Build the voice picker from (voice_id, name, gender) tuples"""
+    # Create voice buttons (max 8 per page)
+    keyboard = []
+    row = []
+    
+    for i, (voice_id, name, gender) in enumerate(voices, 1):
+        emoji = "👨" if gender == 'male' else "👩" if gender == 'female' else "👤"
+        button_text = f"{emoji} {name[:12]}"
+        
+        row.append(
+            InlineKeyboardButton(
+                button_text,
+                callback_data=f"voice_{voice_id}"
+            )
+        )
+        
+        if i % 2 == 0:
+            keyboard.append(row)
+            row = []
+    
+    if row:
+        keyboard.append(row)
+    
+    # Add back button
+    keyboard.append([InlineKeyboardButton("🔙 Back", callback_data="back_to_start")])
+    
+    return InlineKeyboardMarkup(keyboard)
+
+class TelegramBot:
+    """Telegram Bot Handler"""
+    
+    def __init__(self, db: Database = None):
+        self.bot_token = os.getenv("BOT_TOKEN")
+        self.application = None
+        
+        # Use the web app's Database when given one, so pool and caches are shared
+        self._owns_db = db is None
+        self.db = Database() if db is None else db
+        self.minimax = MinimaxAPI()
+        
+        if not self.bot_token:
+            logger.error("❌ BOT_TOKEN environment variable not set!")
+            raise ValueError("BOT_TOKEN is required")
+    
+    async def start_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Handle /start command"""
+        user = update.effective_user
+        welcome_text = WELCOME_TEXT.format(first_name=user.first_name, admin_url=ADMIN_URL)
+        
+        # Add user to database
+        await self.db.add_user(
+            telegram_id=user.id,
+            username=user.username,
+            first_name=user.first_name,
+            last_name=user.last_name
+        )
         
-        await update.message.reply_text(help_text, parse_mode=ParseMode.MARKDOWN)
+        await update.message.reply_text(
+            welcome_text,
+            parse_mode=ParseMode.MARKDOWN,
+            reply_markup=_START_MARKUP
+        )
+    
+    async def help_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Handle /help command"""
+        await update.message.reply_text(HELP_TEXT, parse_mode=ParseMode.MARKDOWN)
     
     async def tts_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle /tts command"""
@@ -136,18 +187,28 @@ I can convert text to high-quality speech with multiple voices.
             )
             return
         
+        # Quota is metered in characters, matching the limits shown to users
+        char_count = len(text)
+        
         # Check text length
-        if len(text) > 5000:
+        if char_count > 5000:
             await update.message.reply_text("❌ Text too long. Max 5000 characters.")
             return
         
-        # Check user quota
-        user_quota = await self.db.get_user_quota(user_id)
+        # Check user quota (settings are fetched alongside, not afterwards);
+        # a settings failure is kept and raised inside the try below
+        user_quota, settings = await asyncio.gather(
+            self.db.get_user_quota(user_id),
+            self.db.get_user_settings(user_id),
+            return_exceptions=True
+        )
+        if isinstance(user_quota, BaseException):
+            raise user_quota
         
-        if not user_quota or user_quota.get('remaining', 0) < len(text):
+        if not user_quota or user_quota.get('remaining', 0) < char_count:
             await update.message.reply_text(
                 f"❌ Insufficient quota!\n"
-                f"Required: {len(text):,}\n"
+                f"Required: {char_count:,}\n"
                 f"Available: {user_quota.get('remaining', 0) if user_quota else 0:,}\n\n"
                 f"Set access code: /mycode"
             )
@@ -157,8 +218,8 @@ I can convert text to high-quality speech with multiple voices.
         processing_msg = await update.message.reply_text("🔄 Generating audio...")
         
         try:
-            # Get user settings
-            settings = await self.db.get_user_settings(user_id)
+            if isinstance(settings, BaseException):
+                raise settings
             
             # Generate TTS
             result = await self.minimax.generate_tts(
@@ -175,31 +236,34 @@ I can convert text to high-quality speech with multiple voices.
                 return
             
             # Update quota
-            await self.db.use_quota(user_id, len(text))
+            await self.db.use_quota(user_id, char_count)
             
             # Save to history
             await self.db.add_history(
                 user_id=user_id,
                 text=text[:200],  # Store only first 200 chars
-                char_count=len(text),
+                char_count=char_count,
                 voice_id=settings.get('voice_id')
             )
             
-            # Send audio
-            audio_file = io.BytesIO(result['audio_data'])
-            audio_file.name = f"tts_{user_id}.ogg"
+            # Send audio; name, duration and timeouts are explicit so nothing is probed
+            audio_file = InputFile(result['audio_data'], filename=f"tts_{user_id}.ogg")
             
             caption = (
                 f"✅ *Audio Generated!*\n"
-                f"Characters: {len(text):,}\n"
-                f"Remaining: {user_quota['remaining'] - len(text):,}"
+                f"Characters: {char_count:,}\n"
+                f"Remaining: {user_quota['remaining'] - char_count:,}"
             )
             
             await context.bot.send_voice(
                 chat_id=update.effective_chat.id,
                 voice=audio_file,
+                duration=result.get('duration') or max(1, char_count // 15),
                 caption=caption,
-                parse_mode=ParseMode.MARKDOWN
+                parse_mode=ParseMode.MARKDOWN,
+                read_timeout=30,
+                write_timeout=60,
+                connect_timeout=10
             )
             
             await processing_msg.delete()
@@ -221,7 +285,7 @@ I can convert text to high-quality speech with multiple voices.
             return
         
         # Validate code format
-        if not code.startswith('TTS-') or len(code) < 10:
+        if not _CODE_RE.fullmatch(code):
             await update.message.reply_text(
                 "❌ Invalid code format. Must start with 'TTS-'"
             )
@@ -256,19 +320,15 @@ I can convert text to high-quality speech with multiple voices.
             )
             return
         
-        quota_text = f"""
-📊 *Your Quota*
-
-*Access Code:* `{quota['code']}`
-*Total:* {quota['total']:,} characters
-*Used:* {quota['used']:,} characters
-*Remaining:* {quota['remaining']:,} characters
-*Usage:* {(quota['used']/quota['total']*100):.1f}%
-
-*Estimated Usage:*
-• Short messages (100 chars): ~{quota['remaining']//100:,} times
-• Medium messages (500 chars): ~{quota['remaining']//500:,} times
-        """
+        quota_text = QUOTA_TEXT.format(
+            code=quota['code'],
+            total=quota['total'],
+            used=quota['used'],
+            remaining=quota['remaining'],
+            usage=quota['used'] / quota['total'] * 100,
+            short_uses=quota['remaining'] // 100,
+            medium_uses=quota['remaining'] // 500
+        )
         
         await update.message.reply_text(quota_text, parse_mode=ParseMode.MARKDOWN)
     
@@ -300,32 +360,13 @@ I can convert text to high-quality speech with multiple voices.
             await query.edit_message_text("❌ No voices available")
             return
         
-        # Create voice buttons (max 8 per page)
-        keyboard = []
-        row = []
-        
-        for i, voice in enumerate(voices[:8], 1):
-            emoji = "👨" if voice.get('gender') == 'male' else "👩" if voice.get('gender') == 'female' else "👤"
-            button_text = f"{emoji} {voice['name'][:12]}"
-            
-            row.append(
-                InlineKeyboardButton(
-                    button_text,
-                    callback_data=f"voice_{voice['voice_id']}"
-                )
-            )
-            
-            if i % 2 == 0:
-                keyboard.append(row)
-                row = []
-        
-        if row:
-            keyboard.append(row)
-        
-        # Add back button
-        keyboard.append([InlineKeyboardButton("🔙 Back", callback_data="back_to_start")])
-        
-        reply_markup = InlineKeyboardMarkup(keyboard)
+        # Only the first 8 voices get buttons; the markup is rebuilt when they change.
+        # self.db is the web app's Database, so admin additions drop this listing cache
+        voices_key = tuple(
+            (voice['voice_id'], voice['name'], voice.get('gender'))
+            for voice in voices[:8]
+        )
+        reply_markup = _voices_markup(voices_key)
         
         await query.edit_message_text(
             "🎵 *Select a Voice*\n\n"
@@ -334,7 +375,7 @@ I can convert text to high-quality speech with multiple voices.
             reply_markup=reply_markup
         )
     
-    async def setup_commands(self):
+    async def setup_commands(self, application: Application = None):
         """Setup bot commands"""
         commands = [
             ("start", "Start the bot"),
@@ -348,10 +389,22 @@ I can convert text to high-quality speech with multiple voices.
         
         await self.application.bot.set_my_commands(commands)
     
-    def run(self):
-        """Run the bot"""
-        # Create application
-        self.application = Application.builder().token(self.bot_token).build()
+    async def shutdown(self, application: Application = None):
+        """Release shared clients when the bot stops"""
+        await self.minimax.close()
+        if self._owns_db:
+            await self.db.close_pool()
+    
+    def build_application(self):
+        """Create the application and register handlers"""
+        # Create application with pooled HTTP/2 connections to the Bot API
+        self.application = (
+            Application.builder()
+            .token(self.bot_token)
+            .get_updates_request(HTTPXRequest(connection_pool_size=32, pool_timeout=10, http_version="2"))
+            .request(HTTPXRequest(connection_pool_size=64, http_version="2"))
+            .build()
+        )
         
         # Add handlers
         self.application.add_handler(CommandHandler("start", self.start_command))
@@ -371,6 +424,11 @@ I can convert text to high-quality speech with multiple voices.
         
         # Setup commands
         self.application.post_init = self.setup_commands
+        self.application.post_shutdown = self.shutdown
+    
+    def run(self):
+        """Run the bot standalone (blocks until stopped)"""
+        self.build_application()
         
         # Start polling
         logger.info("🤖 Starting Telegram bot...")
@@ -379,12 +437,41 @@ I can convert text to high-quality speech with multiple voices.
             drop_pending_updates=True
         )
     
+    async def start_async(self):
+        """Start polling on the already running event loop"""
+        self.build_application()
+        
+        logger.info("🤖 Starting Telegram bot...")
+        await self.application.initialize()
+        await self.setup_commands()
+        await self.application.updater.start_polling(
+            allowed_updates=Update.ALL_TYPES,
+            drop_pending_updates=True
+        )
+        await self.application.start()
+    
+    async def stop_async(self):
+        """Stop polling and release resources"""
+        logger.info("🛑 Stopping Telegram bot...")
+        
+        # Startup may have been cancelled part-way, so only undo what ran
+        try:
+            if self.application is not None:
+                if self.application.updater.running:
+                    await self.application.updater.stop()
+                if self.application.running:
+                    await self.application.stop()
+                await self.application.shutdown()
+        finally:
+            await self.shutdown()
+    
     async def handle_message(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle regular messages"""
         # If user is setting access code
         message = update.message.text
         
-        if message.startswith('TTS-'):
+        # Cheap length/first-char checks turn away ordinary text before the regex
+        if len(message) >= 10 and message[0] == 'T' and _CODE_RE.fullmatch(message):
             # User is entering access code
             await self.set_access_code(update, context)
         else:
@@ -394,6 +481,3 @@ I can convert text to high-quality speech with multiple voices.
                 parse_mode=ParseMode.MARKDOWN
             )
 
-
-# Create bot instance
-bot = TelegramBot()
\ No newline at end of file